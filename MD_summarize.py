@@ -4,12 +4,18 @@ Markdown文件分析脚本
 """
 
 import os
-import glob
+import asyncio
 import json
+import mmap
 import argparse
+from dataclasses import dataclass
 from datetime import datetime
 from typing import List, Dict, Any
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from tenacity import retry, stop_after_attempt, wait_exponential_jitter, retry_if_exception
 from pathlib import Path
 
 # 配置区域 - 请修改这里的路径
@@ -22,6 +28,35 @@ API_BASE = "https://api.siliconflow.cn/v1"
 API_KEY = "your-api-key"
 MODEL = "deepseek-ai/DeepSeek-R1"
 
+# 逐篇提炼要点时同时进行的API请求数，请根据你的账号速率限制调整（不超过连接池大小16）
+MAX_CONCURRENCY = 8
+
+# 遇到限流或服务端错误时自动重试的HTTP状态码
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# 请求超时（连接超时, 读取超时），单位秒，避免API无响应时一直卡住
+REQUEST_TIMEOUT = (10, 600)
+
+# 读取markdown文件时的缓冲区大小，超过该大小的文件改用内存映射读取
+READ_BUFFER_SIZE = 1 << 20
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    """判断请求异常是否值得重试：网络错误、超时，以及限流或服务端错误"""
+    if isinstance(exc, requests.HTTPError):
+        return exc.response is not None and exc.response.status_code in RETRY_STATUSES
+    return isinstance(exc, (requests.Timeout, requests.ConnectionError,
+                            requests.exceptions.ChunkedEncodingError))
+
+
+@dataclass(slots=True)
+class MarkdownFile:
+    """已读取的markdown文件"""
+    filename: str
+    content: str
+    path: str
+
+
 class MarkdownAnalyzer:
     def __init__(self, api_key: str, api_base: str = None, model: str = "deepseek-ai/DeepSeek-R1"):
         """
@@ -39,8 +74,34 @@ class MarkdownAnalyzer:
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json"
         }
+        # 复用连接池，避免每次请求都重新进行TCP/TLS握手
+        # 重试统一由_post上的tenacity负责，连接池本身不再重试，避免两层重试叠加
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount("https://", HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=16,
+            max_retries=Retry(total=0)
+        ))
     
-    def read_markdown_files(self, directory: str) -> List[Dict[str, str]]:
+    @staticmethod
+    def _read_text(file_path: str) -> str:
+        """
+        以UTF-8整体读取文本文件
+
+        Args:
+            file_path: 文件路径
+
+        Returns:
+            文件内容
+        """
+        with open(file_path, 'rb', buffering=READ_BUFFER_SIZE) as f:
+            if os.fstat(f.fileno()).st_size > READ_BUFFER_SIZE:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return str(mm, 'utf-8')
+            return f.read().decode('utf-8')
+
+    def read_markdown_files(self, directory: str) -> List[MarkdownFile]:
         """
         读取目录下的所有markdown文件
         
@@ -48,32 +109,64 @@ class MarkdownAnalyzer:
             directory: 目录路径
             
         Returns:
-            包含文件名和内容的字典列表
+            包含文件名和内容的MarkdownFile列表
         """
         md_files = []
-        pattern = os.path.join(directory, "*.md")
+        # 与 glob("*.md") 相同，只取目录下的普通文件并忽略隐藏文件
+        with os.scandir(directory) as it:
+            md_entries = [
+                entry for entry in it
+                if entry.name.endswith(".md") and not entry.name.startswith(".")
+                and entry.is_file()
+            ]
         
-        for file_path in glob.glob(pattern):
+        for entry in md_entries:
             # 跳过文件名开头为research_report的文件
-            filename = os.path.basename(file_path)
+            filename = entry.name
+            file_path = entry.path
             if filename.startswith("research_report"):
                 print(f"跳过文件: {file_path}")
                 continue
             
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    md_files.append({
-                        'filename': filename,
-                        'content': content,
-                        'path': file_path
-                    })
+                content = self._read_text(file_path)
+                md_files.append(MarkdownFile(
+                    filename=filename,
+                    content=content,
+                    path=file_path
+                ))
                 print(f"已读取文件: {file_path}")
             except Exception as e:
                 print(f"读取文件失败 {file_path}: {e}")
         
         return md_files
     
+    @retry(
+        stop=stop_after_attempt(6),
+        wait=wait_exponential_jitter(initial=1, max=30),
+        retry=retry_if_exception(_is_retryable),
+        reraise=True,
+    )
+    def _post(self, data: Dict[str, Any]) -> bytes:
+        """
+        发送API请求，遇到网络错误、限流或服务端错误时以指数退避重试
+
+        Args:
+            data: 请求体
+
+        Returns:
+            API响应体
+        """
+        with self.session.post(
+            f"{self.api_base}/chat/completions",
+            json=data,
+            stream=True,
+            timeout=REQUEST_TIMEOUT,
+        ) as response:
+            # 收到响应头后立即检查状态码，出错时不再下载响应体
+            response.raise_for_status()
+            return response.content
+
     def call_llm_api(self, prompt: str, max_tokens: int = 4000) -> str:
         """
         调用LLM API
@@ -93,38 +186,96 @@ class MarkdownAnalyzer:
         }
         
         try:
-            response = requests.post(
-                f"{self.api_base}/chat/completions",
-                headers=self.headers,
-                json=data,
-            )
-            response.raise_for_status()
+            body = self._post(data)
             
-            result = response.json()
+            result = orjson.loads(body)
             return result['choices'][0]['message']['content']
         
         except requests.exceptions.RequestException as e:
             print(f"API调用失败: {e}")
             return ""
-        except KeyError as e:
+        except (KeyError, orjson.JSONDecodeError) as e:
             print(f"API响应格式错误: {e}")
             return ""
     
-    def analyze_papers(self, md_files: List[Dict[str, str]]) -> str:
+    async def _summarize_one(self, index: int, file_info: MarkdownFile,
+                             semaphore: asyncio.Semaphore) -> str:
+        """
+        提炼单篇论文的要点（map阶段）
+
+        Args:
+            index: 论文编号
+            file_info: markdown文件信息
+            semaphore: 限制并发请求数的信号量
+
+        Returns:
+            论文要点，调用失败时返回原始内容
+        """
+        prompt = f"""
+        你是一位专业的研究分析师。请提炼以下论文总结的要点，包括研究问题、所用方法、主要结论和创新点。
+        内容应简明扼要，控制在500字以内。使用中文撰写。
+
+        论文 {index}: {file_info.filename}
+        {file_info.content}
+        """
+        async with semaphore:
+            # call_llm_api为同步调用，放到线程中执行以便并发
+            summary = await asyncio.to_thread(self.call_llm_api, prompt)
+
+        return summary or file_info.content
+
+    async def _summarize_all(self, md_files: List[MarkdownFile]) -> List[str]:
+        """
+        并发提炼所有论文的要点
+
+        Args:
+            md_files: markdown文件列表
+
+        Returns:
+            与md_files顺序一致的论文要点列表
+        """
+        semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+        return await asyncio.gather(*(
+            self._summarize_one(i, file_info, semaphore)
+            for i, file_info in enumerate(md_files, 1)
+        ))
+
+    def analyze_papers(self, md_files: List[MarkdownFile]) -> str:
         """
         分析论文内容并生成研究报告
+
+        先并发提炼每篇论文的要点，再汇总生成报告，避免所有原文塞进同一个请求而超出上下文长度
         
         Args:
             md_files: markdown文件列表
             
+        Returns:
+            生成的研究报告
+        """
+        print(f"正在逐篇提炼论文要点（共 {len(md_files)} 篇）...")
+        summaries = asyncio.run(self._summarize_all(md_files))
+
+        return self._combine(md_files, summaries)
+
+    def _combine(self, md_files: List[MarkdownFile], summaries: List[str]) -> str:
+        """
+        汇总各论文要点并生成研究报告（reduce阶段）
+
+        Args:
+            md_files: markdown文件列表
+            summaries: 与md_files顺序一致的论文要点列表
+
         Returns:
             生成的研究报告
         """
         # 构建分析提示词
-        papers_content = ""
-        for i, file_info in enumerate(md_files, 1):
-            papers_content += f"\n=== 论文 {i}: {file_info['filename']} ===\n"
-            papers_content += file_info['content'] + "\n"
+        # 先收集片段再一次性拼接，避免反复 += 大字符串带来的二次方开销
+        parts = []
+        for i, (file_info, summary) in enumerate(zip(md_files, summaries), 1):
+            parts.append(f"\n=== 论文 {i}: {file_info.filename} ===\n")
+            parts.append(summary)
+            parts.append("\n")
+        papers_content = "".join(parts)
         
 #         prompt = f"""
 # 你是一位专业的研究分析师。请分析以下论文总结内容，生成一份综合研究报告。
@@ -240,10 +391,10 @@ def main():
 
     # 在报告末尾追加“论文编号 ↔ 文件名”的对应关系，方便查看引用来源
     if report:
-        appendix = "\n\n---\n\n参考论文列表（编号与文件名对应）：\n"
+        parts = [report, "\n\n---\n\n参考论文列表（编号与文件名对应）：\n"]
         for i, file_info in enumerate(md_files, 1):
-            appendix += f"\n论文 {i}: {file_info['filename']}\n"
-        report += appendix
+            parts.append(f"\n论文 {i}: {file_info.filename}\n")
+        report = "".join(parts)
 
     if not report:
         print("分析失败，报告未保存")
@@ -254,4 +405,5 @@ def main():
 
 
 if __name__ == "__main__":
+    # 安装依赖：pip install requests tenacity orjson
     main()
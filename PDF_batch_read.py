@@ -1,8 +1,13 @@
 import os
+import asyncio
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import aiohttp
 import fitz
-from pdf2image import convert_from_path
-import pytesseract
-import requests
+import orjson
+from tenacity import retry, stop_after_attempt, wait_exponential_jitter, retry_if_exception
 from tqdm import tqdm  # 进度条显示
 
 # 配置参数
@@ -10,21 +15,94 @@ API_URL = "https://api.siliconflow.cn/v1/chat/completions"
 # Buy an API key on siliconflow or elsewhere. Deepseek is cheap, almost free.
 
 DEEPSEEK_API_KEY = "your-api-key"
+MODEL = "deepseek-ai/DeepSeek-R1"
 
 INPUT_DIR = "/path/to/your/pdf"
 # Example: if your file is "/Users/mac/Desktop/file.pdf", then INPUT_DIR = "/Users/mac/Desktop"
 
-def parse_pdf(pdf_path):
-    """解析PDF文件（含OCR处理）"""
+MAX_CONCURRENCY = 8
+# 同时进行的API请求数，请根据你的账号速率限制（QPS）调整
+
+MAX_PARSE_WORKERS = min(os.cpu_count() or 1, 6)
+# 并行解析PDF的进程数，超过6个进程后提速不明显
+
+MAX_CHARS = 65535
+# 每篇PDF发送给模型的最大字符数（控制上下文长度）
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "auto_pdf_reader")
+# 总结结果缓存目录，内容未变的PDF再次运行时直接读取缓存，不再调用API
+
+# 遇到限流或服务端错误时自动重试的HTTP状态码
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+PROMPT = """
+
+You are a helpful assistant. Context information is below.
+
+Please tell me the title of the article, the institution(s) of authors, and the publish year of the article.
+
+Then, using the provided context information, write a comprehensive summary of the artical. Use prior knowledge only if the given context didn't provide enough information. Espectially, notice the problem/difficulties that this work deals with, and how it solves the problems.
+
+Reply in zh-CN. For key terms or specialized nouns, please provide the original term in parentheses.
+
+Context: 
+"""
+# 你可以自行修改prompt，PDF文本会被拼接在其末尾
+
+# 预先序列化请求体中固定不变的部分，每次请求只需拼接PDF文本
+PROMPT_PREFIX = (b'{"model":' + orjson.dumps(MODEL)
+                 + b',"messages":[{"role":"user","content":'
+                 + orjson.dumps(PROMPT)[:-1])
+PROMPT_SUFFIX = b'"}]}'
+
+def iter_pdfs(root_dir, stats=None):
+    """
+    递归遍历目录，逐个返回PDF文件路径（基于os.scandir，无需额外stat）
+    传入stats时，同目录下已有同名markdown的PDF直接计入stats["skipped"]，不再返回
+    """
+    try:
+        with os.scandir(root_dir) as it:
+            entries = list(it)
+    except OSError as e:
+        # 与os.walk一致，跳过无法访问的目录
+        print(f"\n无法访问目录 {root_dir}: {str(e)}")
+        return
+
+    # 每个目录只建一次已生成总结的文件名集合
+    done = None
+    if stats is not None:
+        done = {entry.name[:-3] for entry in entries if entry.name.endswith(".md")}
+
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from iter_pdfs(entry.path, stats)
+        elif entry.name.lower().endswith(".pdf"):
+            if done is not None and os.path.splitext(entry.name)[0] in done:
+                stats["skipped"] += 1
+                continue
+            yield entry.path
+
+
+def parse_pdf(pdf_path, max_chars=MAX_CHARS):
+    """解析PDF文件（含OCR处理），累计超过max_chars个字符后不再解析后续页面"""
     full_text = []
+    total = 0
 
     try:
         # 文本提取
-        doc = fitz.open(pdf_path)
-        for page in doc:
-            full_text.append(page.get_text())
+        with fitz.open(pdf_path) as doc:
+            for page in doc:
+                text = page.get_text("text")
+                full_text.append(text)
+                total += len(text)
+                if total >= max_chars:  # 超出部分发送前也会被截断
+                    break
 
         # 图片OCR处理（根据需求可选，可能不靠谱）
+        # 启用时在这里导入，避免不使用OCR时也要付出加载PIL/poppler等依赖的启动开销
+        # （需额外安装：pip install pdf2image pytesseract）
+        # from pdf2image import convert_from_path
+        # import pytesseract
         # images = convert_from_path(pdf_path)
         # for img in images:
         #     text = pytesseract.image_to_string(
@@ -36,58 +114,96 @@ def parse_pdf(pdf_path):
         print(f"\n解析失败 {pdf_path}: {str(e)}")
         return None
 
-    return "\n".join(full_text)
+    return "\n".join(full_text)[:max_chars]
 
 
-def summarize_text(text):
-    """调用LLM API生成总结"""
-    headers = {"Authorization": f"Bearer {DEEPSEEK_API_KEY}"}
-    prompt = f"""
+def _load_cached_summary(key):
+    """读取缓存的总结，未命中时返回None"""
+    try:
+        with open(os.path.join(CACHE_DIR, f"{key}.md"), "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+    except (OSError, UnicodeDecodeError) as e:
+        # 缓存目录不可用或缓存文件损坏时按未命中处理
+        print(f"\n缓存读取失败: {str(e)}")
+        return None
 
-You are a helpful assistant. Context information is below.
 
-Please tell me the title of the article, the institution(s) of authors, and the publish year of the article.
+def _save_cached_summary(key, summary):
+    """原子写入总结缓存（先写临时文件再替换），避免中断时留下不完整的缓存"""
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(summary)
+            os.replace(tmp_path, os.path.join(CACHE_DIR, f"{key}.md"))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    except OSError as e:
+        print(f"\n缓存写入失败: {str(e)}")
 
-Then, using the provided context information, write a comprehensive summary of the artical. Use prior knowledge only if the given context didn't provide enough information. Espectially, notice the problem/difficulties that this work deals with, and how it solves the problems.
 
-Reply in zh-CN. For key terms or specialized nouns, please provide the original term in parentheses.
+def _is_retryable(exc):
+    """判断请求异常是否值得重试：网络错误、超时，以及限流或服务端错误"""
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return exc.status in RETRY_STATUSES
+    return isinstance(exc, (
+        aiohttp.ClientConnectionError,
+        aiohttp.ClientPayloadError,
+        asyncio.TimeoutError,
+    ))
 
-Context: 
-{text[:65535]}"""  # 控制上下文长度
 
+@retry(
+    stop=stop_after_attempt(6),
+    wait=wait_exponential_jitter(initial=1, max=30),
+    retry=retry_if_exception(_is_retryable),
+    reraise=True,
+)
+async def _post(session, payload):
+    """发送API请求，遇到网络错误、限流或服务端错误时以指数退避重试"""
+    async with session.post(API_URL, data=payload) as response:
+        # 收到响应头后立即检查状态码，出错时不再读取响应体
+        response.raise_for_status()
+        return orjson.loads(await response.read())
+
+
+async def summarize_text(session, text):
+    """调用LLM API生成总结"""
+    # 只需序列化PDF文本本身，拼接到预先构建好的请求体前后缀之间
     try:
-        response = requests.post(
-            API_URL,
-            headers=headers,
-            json={
-                "model": "deepseek-ai/DeepSeek-R1",
-                "messages": [{"role": "user", "content": prompt}]
-            }
-        )
-        
-        return response.json()["choices"][0]["message"]["content"]
-    except Exception as e:
-        print(f"\nAPI调用失败: {str(e)}")
+        context = orjson.dumps(text[:MAX_CHARS])[1:-1]  # 控制上下文长度
+    except orjson.JSONEncodeError as e:
+        print(f"\n构建请求失败: {str(e)}")
         return None
+    payload = PROMPT_PREFIX + context + PROMPT_SUFFIX
 
+    # 以完整请求体（含模型名和prompt）的哈希作为缓存键，更换模型或PDF内容变化时自动失效
+    key = hashlib.sha256(payload).hexdigest()
+    cached = _load_cached_summary(key)
+    if cached is not None:
+        return cached
 
-def process_single_file(pdf_path):
-    """处理单个PDF文件"""
-    # 生成输出路径
-    base_name = os.path.splitext(pdf_path)[0]
-    md_path = f"{base_name}.md"
+    try:
+        result = await _post(session, payload)
+
+        summary = result["choices"][0]["message"]["content"]
+    except Exception as e:
+        print(f"\nAPI调用失败: {str(e)}")
+        return None
 
-    # 跳过已处理文件
-    if os.path.exists(md_path):
-        return "skipped"
+    if summary:
+        _save_cached_summary(key, summary)
+    return summary
 
-    # 解析PDF
-    pdf_text = parse_pdf(pdf_path)
-    if not pdf_text:
-        return "failed"
 
+async def process_single_file(session, pdf_path, md_path, pdf_text):
+    """为单个已解析的PDF生成并保存总结"""
     # 生成总结
-    summary = summarize_text(pdf_text)
+    summary = await summarize_text(session, pdf_text)
     if not summary:
         return "failed"
 
@@ -103,35 +219,137 @@ def process_single_file(pdf_path):
         return "failed"
 
 
-def batch_process_pdfs(root_dir):
-    """批量处理目录中的所有PDF"""
-    # 收集所有PDF文件
-    pdf_files = []
-    for dirpath, _, filenames in os.walk(root_dir):
-        for f in filenames:
-            if f.lower().endswith(".pdf"):
-                pdf_files.append(os.path.join(dirpath, f))
+def _record(stats, pbar, result):
+    """记录单个文件的处理结果并刷新进度条"""
+    stats[result] += 1
+    pbar.update(1)
+    pbar.set_postfix(stats)
+
+
+def _walk_pdfs(pdf_files, loop, path_queue, slots, stop):
+    """在单独的线程中遍历目录树（os.scandir会阻塞），将PDF路径交给事件循环中的解析协程"""
+    try:
+        for pdf_path in pdf_files:
+            # 限制已取出但尚未开始解析的路径数量，避免遍历远远领先于解析
+            while not slots.acquire(timeout=0.5):
+                if stop.is_set():
+                    return
+            loop.call_soon_threadsafe(path_queue.put_nowait, pdf_path)
+    finally:
+        # 通知所有解析协程遍历已结束
+        for _ in range(MAX_PARSE_WORKERS):
+            loop.call_soon_threadsafe(path_queue.put_nowait, None)
 
-    print(f"找到 {len(pdf_files)} 个PDF文件")
 
+async def _parse_worker(path_queue, slots, pool, queue, stats, pbar):
+    """生产者：在进程池中解析PDF，将文本放入队列"""
+    loop = asyncio.get_running_loop()
+    while True:
+        pdf_path = await path_queue.get()
+        if pdf_path is None:
+            break
+        slots.release()
+
+        # 生成输出路径
+        base_name = os.path.splitext(pdf_path)[0]
+        md_path = f"{base_name}.md"
+
+        # 跳过已处理文件
+        if os.path.exists(md_path):
+            _record(stats, pbar, "skipped")
+            continue
+
+        # 解析PDF（CPU密集，放到进程池中执行，不阻塞事件循环）
+        pdf_text = await loop.run_in_executor(pool, parse_pdf, pdf_path)
+        if not pdf_text:
+            _record(stats, pbar, "failed")
+            continue
+
+        await queue.put((pdf_path, md_path, pdf_text))
+
+
+async def _summarize_worker(session, queue, stats, pbar):
+    """消费者：从队列中取出解析结果，调用API生成总结"""
+    while True:
+        item = await queue.get()
+        if item is None:
+            break
+        # 单个文件出现意外错误时只记为失败，不能让消费者退出，
+        # 否则生产者会在已满的队列上永远等待
+        try:
+            result = await process_single_file(session, *item)
+        except Exception as e:
+            print(f"\n处理异常 {item[0]}: {str(e)}")
+            result = "failed"
+        _record(stats, pbar, result)
+
+
+async def _process_all(pdf_files, stats):
+    """解析与总结流水线：进程池解析PDF，异步并发调用API"""
+    # 总结可能耗时很久，不限制总超时；但限制连接和单次读取的等待时间，避免API无响应时一直卡住
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=600)
+    # 所有请求共用同一个连接池，复用TCP/TLS连接
+    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENCY)
+    headers = {
+        "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
+        "Content-Type": "application/json",
+    }
+    # 限制队列长度，避免解析远远领先于总结而占用大量内存
+    queue = asyncio.Queue(maxsize=MAX_CONCURRENCY * 2)
+    # 目录遍历在线程中进行，避免慢速文件系统上的os.scandir阻塞事件循环
+    loop = asyncio.get_running_loop()
+    path_queue = asyncio.Queue()
+    slots = threading.Semaphore(MAX_PARSE_WORKERS * 2)
+    stop = threading.Event()
+
+    async with aiohttp.ClientSession(connector=connector, headers=headers,
+                                     timeout=timeout) as session:
+        with ProcessPoolExecutor(max_workers=MAX_PARSE_WORKERS) as pool, \
+                tqdm(desc="处理进度") as pbar:  # 文件总数未知，只显示已处理数量
+            # 消费者数量即同时进行的API请求数
+            consumers = [
+                asyncio.create_task(_summarize_worker(session, queue, stats, pbar))
+                for _ in range(MAX_CONCURRENCY)
+            ]
+            try:
+                await asyncio.gather(
+                    loop.run_in_executor(None, _walk_pdfs, pdf_files, loop,
+                                         path_queue, slots, stop),
+                    *(_parse_worker(path_queue, slots, pool, queue, stats, pbar)
+                      for _ in range(MAX_PARSE_WORKERS)),
+                )
+            finally:
+                # 出错或被中断时让遍历线程尽快退出，否则事件循环关闭时会一直等待它
+                stop.set()
+
+            # 解析全部完成后通知消费者退出
+            for _ in consumers:
+                await queue.put(None)
+            await asyncio.gather(*consumers)
+
+
+def batch_process_pdfs(root_dir):
+    """批量处理目录中的所有PDF"""
     # 处理进度跟踪
     stats = {"success": 0, "failed": 0, "skipped": 0}
 
-    # 使用进度条
-    with tqdm(total=len(pdf_files), desc="处理进度") as pbar:
-        for pdf_path in pdf_files:
-            result = process_single_file(pdf_path)
-            stats[result] += 1
-            pbar.update(1)
-            pbar.set_postfix(stats)
+    # 边遍历边处理，无需等待整个目录树扫描完成（已有总结的文件在遍历时直接跳过）
+    # 遍历在单独的线程中进行，跳过数先单独计数，处理结束后再合并，避免跨线程修改stats
+    scan_stats = {"skipped": 0}
+    pdf_files = iter_pdfs(root_dir, scan_stats)
+
+    # 解析与总结并行进行（带进度条）
+    asyncio.run(_process_all(pdf_files, stats))
+    stats["skipped"] += scan_stats["skipped"]
 
     # 打印统计结果
-    print(f"\n处理完成：")
+    print(f"\n找到 {sum(stats.values())} 个PDF文件")
+    print(f"处理完成：")
     print(f"成功: {stats['success']}")
     print(f"跳过: {stats['skipped']}")
     print(f"失败: {stats['failed']}")
 
 
 if __name__ == "__main__":
-    # 安装依赖：pip install pymupdf pdf2image pytesseract requests tqdm
+    # 安装依赖：pip install pymupdf aiohttp tenacity orjson tqdm
     batch_process_pdfs(INPUT_DIR)
@@ -1,16 +1,43 @@
 import os
 import re
 import fitz  # PyMuPDF
+import numpy as np
 from tqdm import tqdm
 import unicodedata
 
+# 预编译正则表达式，避免每次调用时重复编译
+_NONWORD_RE = re.compile(r'[^\w\u4e00-\u9fa5-]')
+_UNDERSCORES_RE = re.compile(r'_+')
+_HEADER_RE = re.compile(r'page|第.*页|confidential', re.I)
+
+# 查找最大字号文本时不需要图片块，去掉该标志可显著减小dict结果
+_TITLE_DICT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+
+def iter_pdfs(root_dir):
+    """递归遍历目录，逐个返回PDF文件路径（基于os.scandir，无需额外stat）"""
+    try:
+        # 先取出当前目录的全部条目，避免边遍历边重命名时重复处理改名后的文件
+        with os.scandir(root_dir) as it:
+            entries = list(it)
+    except OSError as e:
+        # 与os.walk一致，跳过无法访问的目录
+        print(f"\n无法访问目录 {root_dir}: {str(e)}")
+        return
+
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from iter_pdfs(entry.path)
+        elif entry.name.lower().endswith(".pdf"):
+            yield entry.path
+
 
 def sanitize_filename(title):
     """清理文件名中的非法字符"""
     # 保留允许的字符（汉字、字母、数字、下划线和连字符）
     cleaned = unicodedata.normalize('NFKC', title)  # 转换全角字符
-    cleaned = re.sub(r'[^\w\u4e00-\u9fa5-]', '_', cleaned)  # 替换非法字符
-    cleaned = re.sub(r'_+', '_', cleaned)  # 合并连续下划线
+    cleaned = _NONWORD_RE.sub('_', cleaned)  # 替换非法字符
+    cleaned = _UNDERSCORES_RE.sub('_', cleaned)  # 合并连续下划线
     return cleaned.strip('_')[:200]  # 限制长度
 
 
@@ -24,8 +51,11 @@ def extract_pdf_title(pdf_path):
             #     return meta_title
 
             # 方法2：分析前两页内容
-            for page_num in range(min(2, len(doc))):
+            num_pages = min(2, len(doc))
+            pages = []
+            for page_num in range(num_pages):
                 page = doc.load_page(page_num)
+                pages.append(page)
                 text = page.get_text("text")
 
                 # 查找可能标题的特征
@@ -33,22 +63,22 @@ def extract_pdf_title(pdf_path):
                 for line in lines[:10]:  # 检查前10行
                     if 10 <= len(line) <= 200 and not line.isdigit():
                         # 排除页眉页脚常见内容
-                        if re.search(r'page|第.*页|confidential', line, re.I):
+                        if _HEADER_RE.search(line):
                             continue
                         return line
 
-                # 方法3：查找最大字号文本
-                blocks = page.get_text("dict")["blocks"]
-                font_sizes = []
-                for b in blocks:
-                    if "lines" in b:
-                        for line in b["lines"]:
-                            for span in line["spans"]:
-                                font_sizes.append((span["text"], span["size"]))
-                if font_sizes:
-                    largest = max(font_sizes, key=lambda x: x[1])
-                    if largest[1] > 11:  # 忽略正文字号
-                        return largest[0]
+            # 方法3：查找最大字号文本（dict模式开销大，仅在前两页都未找到标题时使用）
+            for page in pages:
+                blocks = page.get_text("dict", flags=_TITLE_DICT_FLAGS)["blocks"]
+                spans = [span for b in blocks if "lines" in b
+                         for line in b["lines"] for span in line["spans"]]
+                if spans:
+                    # 用NumPy向量化查找最大字号，避免逐个span调用Python比较
+                    sizes = np.fromiter((span["size"] for span in spans),
+                                        dtype=np.float32, count=len(spans))
+                    idx = int(sizes.argmax())
+                    if sizes[idx] > 11:  # 忽略正文字号
+                        return spans[idx]["text"]
 
     except Exception as e:
         print(f"\n解析失败 {pdf_path}: {str(e)}")
@@ -77,18 +107,11 @@ def rename_pdf_file(pdf_path, new_name):
 
 def process_folder(root_dir):
     """处理目录及其子目录"""
-    pdf_files = []
-    for dirpath, _, filenames in os.walk(root_dir):
-        for f in filenames:
-            if f.lower().endswith(".pdf"):
-                pdf_files.append(os.path.join(dirpath, f))
-
-    print(f"找到 {len(pdf_files)} 个PDF文件")
-
     stats = {"renamed": 0, "failed": 0, "skipped": 0}
 
-    with tqdm(total=len(pdf_files), desc="处理进度") as pbar:
-        for pdf_path in pdf_files:
+    # 边遍历边处理，无需等待整个目录树扫描完成（总数未知，进度条只显示已处理数量）
+    with tqdm(desc="处理进度") as pbar:
+        for pdf_path in iter_pdfs(root_dir):
             try:
                 title = extract_pdf_title(pdf_path)
                 if not title:
@@ -115,7 +138,8 @@ def process_folder(root_dir):
                 stats["failed"] += 1
                 pbar.update(1)
 
-    print("\n处理结果：")
+    print(f"\n找到 {sum(stats.values())} 个PDF文件")
+    print("处理结果：")
     print(f"成功重命名: {stats['renamed']}")
     print(f"失败文件: {stats['failed']}")
     print(f"跳过文件: {stats['skipped']}")
@@ -125,5 +149,5 @@ if __name__ == "__main__":
     # 配置参数
     PDF_DIR = "/path/to/your/pdf"  # 修改为你的PDF目录
 
-    # 安装依赖：pip install pymupdf tqdm
+    # 安装依赖：pip install pymupdf numpy tqdm
     process_folder(PDF_DIR)